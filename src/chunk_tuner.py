@@ -0,0 +1,165 @@
+"""
+Подбор минимального стабильного размера блока захвата (chunk) для микрофона.
+
+Для каждого размера-кандидата (от большего к меньшему) открывается поток на выбранном
+устройстве и несколько секунд крутится цикл, повторяющий работу monitor_mic:
+чтение блока, расчёт уровня, пауза. Замеряются джиттер интервалов между чтениями,
+число переполнений входного буфера и доля процессорного времени цикла.
+Выбирается наименьший размер, прошедший все пороги стабильности.
+
+Пример:
+    python chunk_tuner.py --device 1 --write
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pyaudio
+
+SETTINGS_FILE = "talk-to-press-settings.json"
+DEFAULT_CHUNK = 2205
+# Кандидаты при 22050 Гц: 100, 80, 60, 50, 40, 30, 20 мс
+CANDIDATE_CHUNKS = (2205, 1764, 1323, 1102, 882, 662, 441)
+MEASURE_SECONDS = 3.0
+LOOP_SLEEP = 0.01  # Пауза в конце итерации monitor_mic
+
+# Пороги стабильности
+MAX_OVERFLOWS = 0
+MAX_JITTER_RATIO = 0.5  # 99-й перцентиль отклонения интервала от длительности блока, в долях блока
+MAX_CPU_SHARE = 0.05  # Доля процессорного времени, которую может занимать цикл
+
+# Переполнения в рабочем цикле: столько переполнений за окно (с) — и блок увеличивается на шаг
+LIVE_OVERFLOW_LIMIT = 3
+LIVE_OVERFLOW_WINDOW = 30.0
+
+
+def measure_chunk(p, device_index, chunk, rate=22050, audio_format=pyaudio.paInt16, channels=1,
+                  seconds=MEASURE_SECONDS):
+    """
+    Гоняет цикл чтения с размером блока chunk и возвращает словарь с замерами.
+    Если устройство не открывается с таким размером, в результате будет "error".
+    """
+    result = {"chunk": chunk, "overflows": 0, "jitter_ms": None, "cpu_share": None}
+    try:
+        stream = p.open(format=audio_format, channels=channels, rate=rate, input=True,
+                        input_device_index=device_index, frames_per_buffer=chunk)
+    except OSError as e:
+        result["error"] = str(e)
+        return result
+
+    intervals = []
+    last_read = None
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    try:
+        while time.perf_counter() - wall_start < seconds:
+            try:
+                data = np.frombuffer(stream.read(chunk, exception_on_overflow=True), dtype=np.int16)
+            except OSError as e:
+                if e.errno != pyaudio.paInputOverflowed:
+                    result["error"] = str(e)
+                    break
+                result["overflows"] += 1
+                last_read = None
+                continue
+            np.mean(np.abs(data))
+            now = time.perf_counter()
+            if last_read is not None:
+                intervals.append(now - last_read)
+            last_read = now
+            time.sleep(LOOP_SLEEP)
+    finally:
+        wall = time.perf_counter() - wall_start
+        stream.stop_stream()
+        stream.close()
+
+    result["cpu_share"] = (time.thread_time() - cpu_start) / wall
+    if intervals:
+        deviation = np.abs(np.array(intervals) - chunk / rate)
+        result["jitter_ms"] = float(np.percentile(deviation, 99) * 1000)
+    return result
+
+
+def is_stable(result, rate=22050):
+    """
+    Проверяет замеры по порогам стабильности.
+    """
+    if "error" in result or result["jitter_ms"] is None:
+        return False
+    block_ms = result["chunk"] / rate * 1000
+    return (result["overflows"] <= MAX_OVERFLOWS
+            and result["jitter_ms"] <= block_ms * MAX_JITTER_RATIO
+            and result["cpu_share"] <= MAX_CPU_SHARE)
+
+
+def tune_chunk(p, device_index, rate=22050, candidates=CANDIDATE_CHUNKS, seconds=MEASURE_SECONDS, on_result=None):
+    """
+    Перебирает кандидатов от большего к меньшему и возвращает наименьший стабильный размер блока
+    (DEFAULT_CHUNK, если не прошёл ни один). on_result вызывается с замерами каждого кандидата.
+    Перебор останавливается на первом нестабильном размере: меньшие блоки обычно ещё хуже.
+    """
+    best = DEFAULT_CHUNK
+    for chunk in sorted(candidates, reverse=True):
+        result = measure_chunk(p, device_index, chunk, rate=rate, seconds=seconds)
+        stable = is_stable(result, rate)
+        if on_result is not None:
+            on_result(result, stable)
+        if not stable:
+            break
+        best = chunk
+    return best
+
+
+def next_larger_chunk(chunk, candidates=CANDIDATE_CHUNKS):
+    """
+    Возвращает ближайший кандидат больше chunk или None, если больше нет.
+    """
+    larger = [candidate for candidate in candidates if candidate > chunk]
+    return min(larger) if larger else None
+
+
+def save_chunk(device_name, chunk, settings_file=SETTINGS_FILE):
+    """
+    Записывает размер блока для устройства в chunk_by_device, не трогая остальные ключи.
+    """
+    settings = {}
+    if os.path.exists(settings_file):
+        with open(settings_file, 'r') as file:
+            settings = json.load(file)
+    settings.setdefault("chunk_by_device", {})[device_name] = chunk
+    with open(settings_file, 'w') as file:
+        json.dump(settings, file, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the smallest stable capture block size for a microphone.")
+    parser.add_argument("--device", type=int, help="input device index (default: system default input)")
+    parser.add_argument("--seconds", type=float, default=MEASURE_SECONDS, help="measurement time per block size")
+    parser.add_argument("--write", action="store_true", help="save the result to the settings file")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="settings file to update with --write")
+    args = parser.parse_args()
+
+    p = pyaudio.PyAudio()
+    try:
+        info = (p.get_device_info_by_index(args.device) if args.device is not None
+                else p.get_default_input_device_info())
+
+        def report(result, stable):
+            jitter = "-" if result["jitter_ms"] is None else f"{result['jitter_ms']:.1f}"
+            cpu = "-" if result["cpu_share"] is None else f"{result['cpu_share'] * 100:.1f}"
+            print(f"chunk {result['chunk']:>5}: overflows {result['overflows']}, jitter p99 {jitter} ms, "
+                  f"cpu {cpu}% -> {'ok' if stable else result.get('error', 'unstable')}")
+
+        chunk = tune_chunk(p, info['index'], seconds=args.seconds, on_result=report)
+    finally:
+        p.terminate()
+
+    print(f"{info['name']}: chunk {chunk}")
+    if args.write:
+        save_chunk(info['name'], chunk, args.settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Журнал событий программы.
+
+Потоки хука клавиатуры и мониторинга микрофона только кладут компактную запись в очередь
+(QueueHandler без форматирования), а форматирование, вывод в консоль и запись в файл
+с ротацией выполняет фоновый поток QueueListener.
+
+Формат файла — обычный текст или JSON Lines (одно событие на строку), который можно
+воспроизвести в инструментах диагностики через read_events(). Каждый запуск программы
+начинается с события "session_start", по которому журнал делится на сессии (read_sessions()).
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FILE = "talk-to-press.log"
+LOGGER_NAME = "talk_to_press"
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.propagate = False
+_listener = None
+
+
+class EventQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в вызывающем потоке.
+    Поля событий должны быть неизменяемыми (числа, строки, кортежи).
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Человекочитаемая строка: время, уровень, поток, событие и поля key=value.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s")
+
+    def formatMessage(self, record):
+        fields = getattr(record, "fields", None)
+        if fields:
+            record.message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return super().formatMessage(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Одно событие — один JSON-объект в строке.
+    """
+
+    def format(self, record):
+        event = {
+            "t": record.created,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "event": record.getMessage(),
+        }
+        event.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str, ensure_ascii=False)
+
+
+def setup_logging(level="INFO", log_format="text", path=LOG_FILE, max_bytes=1024 * 1024, backup_count=3,
+                  **session_fields):
+    """
+    Настраивает журнал, запускает фоновый поток записи и пишет событие "session_start"
+    с полями session_fields (например, chunk и rate).
+    log_format: "text" или "jsonl".
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonLinesFormatter() if log_format == "jsonl" else TextFormatter()
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    handlers = [file_handler]
+    # В собранном без консоли exe sys.stderr равен None
+    if sys.stderr is not None:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(TextFormatter())
+        handlers.append(console_handler)
+
+    event_queue = queue.SimpleQueue()
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(EventQueueHandler(event_queue))
+    logger.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(event_queue, *handlers)
+    _listener.start()
+    log_event("session_start", **session_fields)
+
+
+def stop_logging():
+    """
+    Дописывает накопившиеся события и останавливает фоновый поток.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Записывает событие. Если уровень отключён, стоит одной проверки.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def log_files(path):
+    """
+    Возвращает файлы журнала в хронологическом порядке: старые копии после ротации
+    (path.N, ..., path.1), затем сам path.
+    """
+    backups = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        backups.append(f"{path}.{number}")
+        number += 1
+    return backups[::-1] + [path]
+
+
+def read_events(path, event=None):
+    """
+    Читает журнал в формате JSON Lines вместе с копиями после ротации и возвращает события
+    (словари), при необходимости только с указанным именем. Строки не в формате JSON
+    (например, записанные при log_format "text") пропускаются.
+    """
+    for file_path in log_files(path):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if event is None or record.get("event") == event:
+                    yield record
+
+
+def read_sessions(path, events=None):
+    """
+    Делит журнал на сессии по событиям "session_start" и возвращает список сессий,
+    каждая — список событий начиная с "session_start" (events — какие ещё события оставить).
+    События до первого "session_start" (начало сессии ушло при ротации) образуют отдельную сессию.
+    """
+    sessions = []
+    for record in read_events(path):
+        name = record.get("event")
+        if name == "session_start" or not sessions:
+            sessions.append([])
+        if name == "session_start" or events is None or name in events:
+            sessions[-1].append(record)
+    return sessions
@@ -0,0 +1,111 @@
+"""
+Режим производительности для потока мониторинга микрофона.
+
+- повышение приоритета потока и (по желанию) привязка к одному ядру;
+- gc.freeze() после запуска, чтобы объекты, созданные при старте, не сканировались сборщиком мусора;
+- отложенные полные сборки мусора (поколение 2), пока идёт разговор;
+- замер самого длинного промежутка между чтениями микрофона (LoopGapMeter), который пишется
+  в журнал и в обычном режиме, чтобы было с чем сравнивать.
+"""
+import ctypes
+import gc
+import os
+import sys
+import threading
+import time
+
+THREAD_PRIORITY_TIME_CRITICAL = 15
+FULL_COLLECTION_DEFERRED = 1_000_000  # Порог поколения 2, при котором полная сборка фактически не наступает
+
+_saved_gc_threshold = None
+
+
+def raise_thread_priority(core=None):
+    """
+    Повышает приоритет вызывающего потока и, если задан core, привязывает его к ядру.
+    Должна вызываться из самого потока мониторинга. Возвращает True, если всё применилось.
+    """
+    if sys.platform == "win32":
+        from ctypes import wintypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.GetCurrentThread.restype = wintypes.HANDLE
+        kernel32.SetThreadPriority.argtypes = (wintypes.HANDLE, ctypes.c_int)
+        kernel32.SetThreadAffinityMask.argtypes = (wintypes.HANDLE, ctypes.c_size_t)
+        kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+        thread = kernel32.GetCurrentThread()
+        ok = bool(kernel32.SetThreadPriority(thread, THREAD_PRIORITY_TIME_CRITICAL))
+        if core is not None:
+            ok = bool(kernel32.SetThreadAffinityMask(thread, 1 << core)) and ok
+        return ok
+
+    # На Linux sched_setaffinity(0) и setpriority для native id действуют на текущий поток
+    ok = True
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -10)
+    except (AttributeError, OSError):
+        ok = False
+    if core is not None:
+        try:
+            os.sched_setaffinity(0, {core})
+        except (AttributeError, OSError):
+            ok = False
+    return ok
+
+
+def freeze_gc():
+    """
+    Собирает мусор и переносит все текущие объекты в постоянное поколение.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def defer_full_collections():
+    """
+    Откладывает сборки поколения 2 (вызывается при начале разговора).
+    """
+    global _saved_gc_threshold
+    if _saved_gc_threshold is None:
+        _saved_gc_threshold = gc.get_threshold()
+        gc.set_threshold(_saved_gc_threshold[0], _saved_gc_threshold[1], FULL_COLLECTION_DEFERRED)
+
+
+def restore_full_collections():
+    """
+    Возвращает исходные пороги сборщика мусора (вызывается после отпускания клавиш).
+    """
+    global _saved_gc_threshold
+    if _saved_gc_threshold is not None:
+        gc.set_threshold(*_saved_gc_threshold)
+        _saved_gc_threshold = None
+
+
+class LoopGapMeter:
+    """
+    Замеряет промежутки между чтениями микрофона. Чтение блокирующее, поэтому в норме
+    промежуток равен длительности блока, а задержка цикла видна как один длинный промежуток.
+    """
+
+    def __init__(self):
+        self.last_tick = None
+        self.max_gap = 0.0
+
+    def tick(self):
+        """
+        Отмечает очередное чтение. Возвращает промежуток в секундах, если это новый максимум, иначе None.
+        """
+        now = time.perf_counter()
+        last_tick, self.last_tick = self.last_tick, now
+        if last_tick is None:
+            return None
+        gap = now - last_tick
+        if gap > self.max_gap:
+            self.max_gap = gap
+            return gap
+        return None
+
+    def reset(self):
+        """
+        Сбрасывает отметку после намеренной паузы (неактивное окно, mute), чтобы она не считалась задержкой.
+        """
+        self.last_tick = None
@@ -0,0 +1,333 @@
+"""
+Офлайн-подбор порога громкости (volume_threshold) и задержки отпускания
+(post_voice_release_delay) по записанным сессиям.
+
+Каждая запись — WAV-файл (16 бит) с разметкой речи рядом, в формате меток Audacity
+(файл с тем же именем и расширением .txt, строки "начало<TAB>конец[<TAB>метка]" в секундах).
+
+Детектор из основной программы моделируется целиком на NumPy: для каждого размера кадра
+уровни считаются один раз, затем вся сетка порог × задержка оценивается broadcasting'ом.
+Результат — Парето-таблица "обрезанная речь" / "ложное открытие".
+
+Вместо WAV можно передать журнал в формате JSON Lines (log_level "DEBUG", log_format "jsonl"):
+уровни берутся из событий "level" одной сессии (запуска программы, по умолчанию последнего),
+включая копии журнала после ротации; метки — из файла .txt рядом с журналом, время отсчитывается
+от события "session_start". Уровни оцениваются только с тем размером кадра, с которым записаны.
+
+Пример:
+    python threshold_sweep.py session1.wav session2.wav --frame-sizes 2205,1102
+    python threshold_sweep.py talk-to-press.log --session -1 --apply 3
+"""
+import argparse
+import json
+import os
+import wave
+
+import numpy as np
+
+from event_log import read_sessions
+
+SETTINGS_FILE = "talk-to-press-settings.json"
+DETECTOR_RATE = 22050  # Частота дискретизации, с которой работает основная программа
+DEFAULT_FRAME_SIZE = 2205  # Значение chunk в основной программе
+BLOCK_ELEMENTS = 4_000_000  # Ограничение размера промежуточного массива (задержки × пороги × кадры)
+
+
+# ==================== ЧТЕНИЕ ЗАПИСЕЙ И РАЗМЕТКИ ====================
+
+def read_wave(path):
+    """
+    Читает WAV-файл и возвращает (отсчёты int16 первого канала, частота дискретизации).
+    """
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: поддерживаются только 16-битные записи")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        data = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    return data[::channels], rate
+
+
+def read_label_intervals(path):
+    """
+    Читает метки Audacity и возвращает массив интервалов речи [(начало, конец), ...] в секундах.
+    """
+    intervals = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            parts = line.split('\t')
+            # Строки частотного диапазона Audacity начинаются с "\"
+            if len(parts) < 2 or parts[0].startswith('\\'):
+                continue
+            intervals.append((float(parts[0]), float(parts[1])))
+    return np.array(intervals, dtype=float).reshape(-1, 2)
+
+
+def read_labels(path, n_samples, rate):
+    """
+    Читает метки Audacity и возвращает булеву маску речи длиной n_samples.
+    """
+    speech = np.zeros(n_samples, dtype=bool)
+    for start, end in read_label_intervals(path):
+        speech[max(int(round(start * rate)), 0):min(int(round(end * rate)), n_samples)] = True
+    return speech
+
+
+def speech_overlap(intervals, starts, ends):
+    """
+    Возвращает, сколько секунд речи приходится на каждый отрезок [starts[i], ends[i]].
+
+    Интервалы меток объединяются в непересекающиеся, затем для каждой границы отрезка
+    накопленная длительность речи находится через np.searchsorted — O(кадры + метки)
+    по памяти, без матрицы кадры × метки.
+    """
+    if not len(intervals):
+        return np.zeros(len(starts))
+    order = np.argsort(intervals[:, 0])
+    label_starts = intervals[order, 0]
+    label_ends = np.maximum.accumulate(intervals[order, 1])
+    # Новый непересекающийся интервал начинается, где метка начинается после конца всех предыдущих
+    is_first = np.concatenate([[True], label_starts[1:] > label_ends[:-1]])
+    is_last = np.concatenate([is_first[1:], [True]])
+    merged_starts = label_starts[is_first]
+    merged_lengths = label_ends[is_last] - merged_starts
+    covered_before = np.concatenate([[0.0], np.cumsum(merged_lengths)[:-1]])
+
+    def coverage(times):
+        # Длительность речи от начала отсчёта до times
+        index = np.searchsorted(merged_starts, times, side='right') - 1
+        safe = np.maximum(index, 0)
+        inside = np.clip(times - merged_starts[safe], 0, merged_lengths[safe])
+        return np.where(index >= 0, covered_before[safe] + inside, 0.0)
+
+    return coverage(ends) - coverage(starts)
+
+
+def read_session(path, labels_path, session=-1):
+    """
+    Читает уровни кадров (события "level") одной сессии журнала и долю речи в каждом кадре.
+    Если размер блока менялся по ходу сессии (подбор chunk, смена микрофона), сессия делится
+    на отрезки с постоянным размером. Возвращает список (уровни, доля речи, размер кадра, частота).
+    """
+    sessions = read_sessions(path, events={"level"})
+    if not -len(sessions) <= session < len(sessions):
+        raise ValueError(f"{path}: нет сессии {session}, в журнале сессий: {len(sessions)}")
+    events = sessions[session]
+    levels_events = [event for event in events if event.get("event") == "level"]
+    if not levels_events:
+        raise ValueError(f"{path}: в сессии нет событий \"level\" (нужны log_level DEBUG и log_format jsonl)")
+
+    volumes = np.array([event["volume"] for event in levels_events])
+    chunks = np.array([event["chunk"] for event in levels_events])
+    rates = np.array([event["rate"] for event in levels_events])
+    durations = chunks / rates
+    # Событие пишется после чтения кадра, поэтому кадр начинается на длительность блока раньше;
+    # время отсчитывается от начала сессии, пропуски (неактивное окно) сохраняются
+    if events[0].get("event") == "session_start":
+        session_start = events[0]["t"]
+    else:
+        session_start = levels_events[0]["t"] - durations[0]
+    starts = np.array([event["t"] for event in levels_events]) - durations - session_start
+    speech = speech_overlap(read_label_intervals(labels_path), starts, starts + durations)
+    speech_share = np.minimum(speech / durations, 1)
+
+    changes = np.flatnonzero((np.diff(chunks) != 0) | (np.diff(rates) != 0)) + 1
+    bounds = np.concatenate([[0], changes, [len(volumes)]])
+    return [(volumes[a:b], speech_share[a:b], int(chunks[a]), int(rates[a])) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def frame_series(samples, speech, frame_len):
+    """
+    Разбивает запись на кадры по frame_len отсчётов (неполный хвост отбрасывается).
+    Возвращает уровни кадров (как в monitor_mic: среднее модуля) и долю речи в каждом кадре.
+    """
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    # int32, чтобы abs(-32768) не переполнялся
+    levels = np.abs(frames.astype(np.int32)).mean(axis=1)
+    speech_share = speech[:n_frames * frame_len].reshape(n_frames, frame_len).mean(axis=1)
+    return levels, speech_share
+
+
+# ==================== МОДЕЛЬ ДЕТЕКТОРА ====================
+
+def evaluate_series(levels, speech_share, frame_duration, thresholds, delays_s):
+    """
+    Оценивает всю сетку задержка × порог сразу для одной записи.
+
+    Решение о нажатии принимается после чтения кадра, поэтому клавиша, нажатая по кадру k,
+    пропускает в игру звук начиная с кадра k + 1: открытость кадра определяется последним
+    превышением порога среди предыдущих кадров. Клавиша удерживается, пока с этого превышения
+    прошло не больше delay секунд (условие отпускания в monitor_mic:
+    current_time - last_above_threshold_time > delay).
+
+    Запись обрабатывается блоками по времени, номер последнего превышения переносится между блоками,
+    так что память ограничена BLOCK_ELEMENTS независимо от длины записи.
+    Возвращает (секунды открытого канала во время речи, секунды открытого канала всего),
+    оба массива формы (задержки, пороги).
+    """
+    n_delays, n_thresholds, n_frames = len(delays_s), len(thresholds), len(levels)
+    open_speech = np.zeros((n_delays, n_thresholds))
+    open_total = np.zeros((n_delays, n_thresholds))
+    # Номер последнего кадра выше порога для каждого порога (-1 — ещё не было)
+    last_above = np.full((n_thresholds, 1), -1)
+    block = max(BLOCK_ELEMENTS // max(n_delays * n_thresholds, 1), 1)
+    for start in range(0, n_frames, block):
+        stop = min(start + block, n_frames)
+        index = np.arange(start, stop)
+        above = levels[None, start:stop] > thresholds[:, None]
+        block_last = np.maximum(np.maximum.accumulate(np.where(above, index, -1), axis=1), last_above)
+        # Последнее превышение до начала каждого кадра
+        last_before = np.concatenate([last_above, block_last[:, :-1]], axis=1)
+        last_above = block_last[:, -1:]
+        ages = np.where(last_before >= 0, (index - 1 - last_before) * frame_duration, np.inf)
+        is_open = ages[None, :, :] <= delays_s[:, None, None]
+        open_speech += is_open @ speech_share[start:stop]
+        open_total += is_open.sum(axis=2)
+    return open_speech * frame_duration, open_total * frame_duration
+
+
+def sweep(recordings, thresholds, delays_ms, frame_sizes, sessions=()):
+    """
+    Прогоняет сетку параметров по всем записям.
+
+    recordings — список (отсчёты, маска речи, частота), sessions — список результатов read_session.
+    Возвращает массив строк формы (N, 5) со столбцами frame_size, threshold, delay_ms, clipped_s,
+    false_open_s и длительность оценённой речи для каждого размера кадра.
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    delays_ms = np.asarray(delays_ms, dtype=float)
+    delays_s = delays_ms / 1000
+    grid_shape = (len(delays_ms), len(thresholds))
+    results = []
+    speech_totals = {}
+    for frame_size in frame_sizes:
+        series = []
+        for samples, speech, rate in recordings:
+            # Размер кадра задан в отсчётах при DETECTOR_RATE — приводим к частоте записи
+            frame_len = max(int(round(frame_size * rate / DETECTOR_RATE)), 1)
+            levels, speech_share = frame_series(samples, speech, frame_len)
+            series.append((levels, speech_share, frame_len / rate))
+        for levels, speech_share, session_frame_size, rate in sessions:
+            if session_frame_size == frame_size:
+                series.append((levels, speech_share, session_frame_size / rate))
+
+        open_speech = np.zeros(grid_shape)
+        open_total = np.zeros(grid_shape)
+        speech_total = 0.0
+        for levels, speech_share, frame_duration in series:
+            if not len(levels):
+                continue
+            series_speech, series_total = evaluate_series(levels, speech_share, frame_duration, thresholds, delays_s)
+            open_speech += series_speech
+            open_total += series_total
+            speech_total += speech_share.sum() * frame_duration
+        speech_totals[frame_size] = speech_total
+        clipped = speech_total - open_speech
+        false_open = open_total - open_speech
+        results.append(np.column_stack([
+            np.full(clipped.size, frame_size, dtype=float),
+            np.broadcast_to(thresholds[None, :], grid_shape).ravel(),
+            np.broadcast_to(delays_ms[:, None], grid_shape).ravel(),
+            clipped.ravel(),
+            false_open.ravel(),
+        ]))
+    return np.concatenate(results), speech_totals
+
+
+def pareto_front(rows):
+    """
+    Оставляет только недоминируемые строки (меньше обрезанной речи и меньше ложных открытий),
+    отсортированные по возрастанию обрезанной речи.
+    """
+    rows = rows[np.lexsort((rows[:, 4], rows[:, 3]))]
+    # Строка входит во фронт, если ложных открытий у неё меньше, чем у всех строк перед ней
+    best_before = np.concatenate([[np.inf], np.minimum.accumulate(rows[:, 4])[:-1]])
+    return rows[rows[:, 4] < best_before]
+
+
+# ==================== ВЫВОД И СОХРАНЕНИЕ ====================
+
+def print_table(front, speech_totals):
+    print(f"{'#':>3}  {'frame':>6}  {'threshold':>9}  {'delay, ms':>9}  {'clipped, s':>12}  {'false open, s':>13}")
+    for i, (frame_size, threshold, delay, clipped, false_open) in enumerate(front):
+        speech_total = speech_totals[int(frame_size)]
+        share = clipped / speech_total * 100 if speech_total else 0
+        print(f"{i:>3}  {frame_size:>6.0f}  {threshold:>9.0f}  {delay:>9.0f}  "
+              f"{clipped:>6.2f} ({share:>4.1f}%)  {false_open:>13.2f}")
+
+
+def apply_settings(row, settings_file=SETTINGS_FILE):
+    """
+    Записывает выбранные порог и задержку в файл настроек, не трогая остальные ключи.
+    """
+    settings = {}
+    if os.path.exists(settings_file):
+        with open(settings_file, 'r') as file:
+            settings = json.load(file)
+    settings["volume_threshold"] = int(row[1])
+    settings["post_voice_release_delay"] = int(row[2])
+    with open(settings_file, 'w') as file:
+        json.dump(settings, file, indent=4)
+
+
+def parse_range(text):
+    """
+    Разбирает "start:stop:step" (stop включительно) или список через запятую.
+    """
+    if ':' in text:
+        start, stop, step = (float(v) for v in text.split(':'))
+        return np.arange(start, stop + step / 2, step)
+    return np.array([float(v) for v in text.split(',')])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep volume threshold and release delay over labelled recordings.")
+    parser.add_argument("recordings", nargs='+',
+                        help="WAV files or JSON-lines session logs; labels are read from <name>.txt (Audacity format)")
+    parser.add_argument("--thresholds", default="100:3000:50", help="start:stop:step or comma list")
+    parser.add_argument("--delays", default="0:2000:100", help="release delays in ms, start:stop:step or comma list")
+    parser.add_argument("--frame-sizes", default=str(DEFAULT_FRAME_SIZE), help="comma list of chunk sizes")
+    parser.add_argument("--session", type=int, default=-1,
+                        help="which program run to take from a session log (0 = oldest, -1 = last)")
+    parser.add_argument("--apply", type=int, metavar="N", help="write row N of the Pareto table to the settings file")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="settings file to update with --apply")
+    args = parser.parse_args()
+
+    frame_sizes = [int(v) for v in args.frame_sizes.split(',')]
+    recordings = []
+    sessions = []
+    for path in args.recordings:
+        labels_path = os.path.splitext(path)[0] + ".txt"
+        try:
+            if path.lower().endswith(".wav"):
+                samples, rate = read_wave(path)
+                recordings.append((samples, read_labels(labels_path, len(samples), rate), rate))
+            else:
+                for segment in read_session(path, labels_path, args.session):
+                    sessions.append(segment)
+                    if segment[2] not in frame_sizes:
+                        frame_sizes.append(segment[2])
+        except (OSError, ValueError, wave.Error) as e:
+            parser.error(str(e))
+
+    rows, speech_totals = sweep(recordings, parse_range(args.thresholds), parse_range(args.delays), frame_sizes,
+                                sessions)
+    front = pareto_front(rows)
+    for frame_size, speech_total in speech_totals.items():
+        print(f"Speech evaluated with frame size {frame_size}: {speech_total:.2f} s")
+    print_table(front, speech_totals)
+
+    if args.apply is not None:
+        if not 0 <= args.apply < len(front):
+            parser.error(f"--apply: row {args.apply} is not in the table (0..{len(front) - 1})")
+        row = front[args.apply]
+        apply_settings(row, args.settings)
+        print(f"Saved volume_threshold={int(row[1])}, post_voice_release_delay={int(row[2])} to {args.settings}")
+        if row[0] != DEFAULT_FRAME_SIZE:
+            print(f"Note: this row was evaluated with frame size {int(row[0])}; the program takes the frame size "
+                  f"per microphone from chunk_by_device (see chunk_tuner.py), default {DEFAULT_FRAME_SIZE}")
+
+
+if __name__ == "__main__":
+    main()
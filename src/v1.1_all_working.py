@@ -1,5 +1,6 @@
 import base64
 import json
+import logging
 import os
 import threading
 import time
@@ -18,6 +19,13 @@ from pynput import keyboard
 from pynput.keyboard import Controller
 from pystray import Icon, MenuItem as item
 
+from chunk_tuner import DEFAULT_CHUNK, LIVE_OVERFLOW_LIMIT, LIVE_OVERFLOW_WINDOW, tune_chunk, save_chunk, \
+    next_larger_chunk
+from event_log import setup_logging, stop_logging, log_event
+from perf_mode import LoopGapMeter, raise_thread_priority, freeze_gc, defer_full_collections, \
+    restore_full_collections
+from voice_delay import DelayedMonitor, measure_loopback_latency
+
 
 # ==================== ФУНКЦИИ РАБОТЫ С КЛАВИШАМИ ====================
 
@@ -100,12 +108,25 @@ def load_settings():
         "fade_sound_enabled": False,  # Флаг: затемнять звук динамиков во время разговора
         "fade_sound_percentage": 90,  # Процент уменьшения громкости при активации PTT
         "mute_all_enabled": False,  # Флаг: включать режим mute для динамиков
-        "mute_key": "m"  # Клавиша для режима mute
+        "mute_key": "m",  # Клавиша для режима mute
+        "log_level": "INFO",  # Уровень журнала событий (DEBUG пишет уровень микрофона каждого кадра)
+        "log_format": "text",  # Формат файла журнала: "text" или "jsonl"
+        "log_max_kb": 1024,  # Размер файла журнала до ротации, КБ
+        "log_backup_count": 3,  # Количество хранимых старых файлов журнала
+        "auto_tune_chunk": False,  # Флаг: подбирать размер блока при запуске для микрофона, которого нет в chunk_by_device
+        "chunk_by_device": {},  # Подобранный размер блока захвата по имени микрофона
+        "voice_delay_enabled": False,  # Флаг: пропускать голос через программу с задержкой (режим задержанного мониторинга)
+        "voice_delay_ms": 150,  # Задержка голоса (мс); на столько же откладывается отпускание клавиш
+        "voice_delay_output": "CABLE Input",  # Фрагмент имени устройства вывода (виртуальный кабель), куда идёт голос
+        "voice_delay_capture": "CABLE Output",  # Фрагмент имени стороны захвата того же кабеля (для замера задержки)
+        "performance_mode": False,  # Флаг: высокий приоритет потока мониторинга, gc.freeze и без полных сборок мусора во время разговора
+        "performance_core": None  # Номер ядра для потока мониторинга в режиме производительности (None — без привязки)
     }
     if os.path.exists(settings_file):
         with open(settings_file, 'r') as file:
             try:
-                return json.load(file)
+                # Ключи, которых нет в старом файле настроек, берём по умолчанию
+                return {**default_settings, **json.load(file)}
             except json.JSONDecodeError:
                 return default_settings
     else:
@@ -135,7 +156,19 @@ def save_settings():
         "fade_sound_enabled": fade_sound_checkbox_var.get(),
         "fade_sound_percentage": int(fade_sound_percent_combobox.get()),
         "mute_all_enabled": mute_all_checkbox.get(),
-        "mute_key": mute_key_entry.get()
+        "mute_key": mute_key_entry.get(),
+        "log_level": log_level,
+        "log_format": log_format,
+        "log_max_kb": log_max_kb,
+        "log_backup_count": log_backup_count,
+        "auto_tune_chunk": auto_tune_chunk,
+        "chunk_by_device": chunk_by_device,
+        "voice_delay_enabled": voice_delay_enabled,
+        "voice_delay_ms": voice_delay_ms,
+        "voice_delay_output": voice_delay_output,
+        "voice_delay_capture": voice_delay_capture,
+        "performance_mode": performance_mode,
+        "performance_core": performance_core
     }
     with open("talk-to-press-settings.json", 'w') as file:
         json.dump(settings, file, indent=4)
@@ -174,15 +207,40 @@ fade_sound_enabled = settings["fade_sound_enabled"]
 fade_sound_percentage = settings["fade_sound_percentage"]
 mute_all_enabled = settings["mute_all_enabled"]
 mute_key = settings["mute_key"]
+log_level = settings["log_level"]
+log_format = settings["log_format"]
+log_max_kb = settings["log_max_kb"]
+log_backup_count = settings["log_backup_count"]
+auto_tune_chunk = settings["auto_tune_chunk"]
+chunk_by_device = settings["chunk_by_device"]
+voice_delay_enabled = settings["voice_delay_enabled"]
+voice_delay_ms = settings["voice_delay_ms"]
+voice_delay_output = settings["voice_delay_output"]
+voice_delay_capture = settings["voice_delay_capture"]
+performance_mode = settings["performance_mode"]
+performance_core = settings["performance_core"]
 # ==================== АУДИО НАСТРОЙКИ ====================
-chunk = 2205
+chunk = DEFAULT_CHUNK  # Размер блока захвата, берётся из chunk_by_device при открытии потока
 audio_format = pyaudio.paInt16
 channels = 1
 rate = 22050
 
+setup_logging(log_level, log_format, max_bytes=log_max_kb * 1024, backup_count=log_backup_count,
+              chunk=chunk, rate=rate)
+
 # Контроллер для эмуляции нажатия клавиш
 keyboard_controller = Controller()
 p = pyaudio.PyAudio()
+# Защищает поток микрофона от закрытия во время чтения (смена микрофона, подбор размера блока)
+stream_lock = threading.RLock()
+stream = None  # Поток чтения с микрофона
+stream_device_index = None  # Устройство, для которого открыт stream
+mic_overflows = 0  # Переполнения входного буфера за время работы
+chunk_tuning_thread = None
+output_stream = None  # Поток вывода задержанного голоса
+delayed_monitor = None
+voice_delay_calibration_thread = None
+loop_gap_meter = LoopGapMeter()  # Самый длинный промежуток между чтениями микрофона
 
 
 def get_available_microphones():
@@ -241,7 +299,8 @@ pressed_keys_global = set()
 def on_press_global(key):
     if key not in pressed_keys_global:
         pressed_keys_global.add(key)
-        print(pressed_keys_global)
+        # Сами клавиши не пишем: журнал сохраняется на диск и стал бы кейлогом
+        log_event("keys", logging.DEBUG, pressed=len(pressed_keys_global))
 
 
 def on_release_global(key):
@@ -288,18 +347,40 @@ def get_local_pressed_keys(field):
 
 
 # ==================== MONITORING МИКРОФОНА ====================
+def release_ptt(active_window, **fields):
+    """
+    Отпускает клавиши push-to-talk и возвращает громкость динамиков после затемнения.
+    """
+    global is_talking, original_speaker_volume
+    log_event("ptt_release", **fields)
+    if performance_mode:
+        restore_full_collections()
+    if active_window != "talk to push settings":
+        for key in reversed(ptt_key_codes):
+            keyboard_controller.release(key)
+        if fade_sound_enabled and original_speaker_volume is not None:
+            volume_control.SetMasterVolumeLevelScalar(original_speaker_volume, None)
+            original_speaker_volume = None
+    is_talking = False
+
+
 def monitor_mic():
     """
     Основной цикл мониторинга уровня звука с микрофона.
     При превышении порога эмулируется нажатие клавиш push-to-talk.
     Также реализованы функции затемнения (fade) динамиков и mute (выключение динамиков).
     """
-    global mute_key_codes, ptt_keys_str, ptt_key_codes, is_talking, muted, ignore_keys_str, last_above_threshold_time, ignore_key_codes, original_speaker_volume, stored_speaker_volume, original_microphone_volume, stored_microphone_volume, pressed_keys_global
+    global mute_key_codes, ptt_keys_str, ptt_key_codes, is_talking, muted, ignore_keys_str, last_above_threshold_time, ignore_key_codes, original_speaker_volume, stored_speaker_volume, original_microphone_volume, stored_microphone_volume, pressed_keys_global, mic_overflows
 
     ignore_key_codes = str_to_keys(ignore_keys_str)
     ptt_key_codes = str_to_keys(ptt_keys_str)
     mute_key_codes = str_to_keys(mute_key)
 
+    if performance_mode:
+        log_event("thread_priority_raised", applied=raise_thread_priority(performance_core), core=performance_core)
+
+    paused = False  # Цикл пропускал чтение микрофона (mute, неактивное окно, игнорируемые клавиши)
+    recent_overflows = []  # Время последних переполнений в пределах LIVE_OVERFLOW_WINDOW
     while True:
         try:
             if mute_all_enabled and all(key in pressed_keys_global for key in mute_key_codes):
@@ -308,7 +389,7 @@ def monitor_mic():
                     volume_control.SetMasterVolumeLevelScalar(0, None)
                     stored_microphone_volume = microphone_volume.GetMasterVolumeLevelScalar()
                     microphone_volume.SetMasterVolumeLevelScalar(0, None)
-                    print("Speakers and microphone muted.")
+                    log_event("muted")
                     muted = True
                 else:
                     if stored_speaker_volume is not None:
@@ -316,10 +397,11 @@ def monitor_mic():
                     if stored_microphone_volume is not None:
                         microphone_volume.SetMasterVolumeLevelScalar(stored_microphone_volume, None)
 
-                    print("Speakers and microphone unmuted.")
+                    log_event("unmuted")
                     muted = False
                     stored_speaker_volume = None
                 time.sleep(1)
+                paused = True
                 continue
 
             # Проверка активного окна
@@ -328,23 +410,72 @@ def monitor_mic():
             if not any(fragment in active_window for fragment in
                        allowed_fragments) and active_window != "talk to push settings":
                 time.sleep(1)
+                paused = True
                 continue
 
-            # Если нажаты клавиши для игнорирования, пропускаем обработку
-            if ignore_keys_enabled and any(key in ignore_key_codes for key in pressed_keys_global):
-                print("Pressing ignored")
-                time.sleep(1)
-                continue
+            # Если нажаты клавиши для игнорирования, не нажимаем и не отпускаем PTT
+            ignoring = ignore_keys_enabled and any(key in ignore_key_codes for key in pressed_keys_global)
+            if ignoring:
+                log_event("ptt_ignored", logging.DEBUG)
+                # В режиме задержанного мониторинга игра слышит микрофон только через программу,
+                # поэтому голос продолжает идти и при ручном PTT
+                if delayed_monitor is None:
+                    time.sleep(1)
+                    paused = True
+                    continue
 
             # Чтение данных с микрофона
-            data = np.frombuffer(stream.read(chunk, exception_on_overflow=False), dtype=np.int16)
+            with stream_lock:
+                # Поток закрыт на время подбора размера блока или не открылся
+                if stream is None:
+                    data = None
+                else:
+                    if paused:
+                        # Пауза не считается задержкой цикла, а звук до паузы не должен попасть в игру
+                        loop_gap_meter.reset()
+                        if delayed_monitor is not None:
+                            delayed_monitor.reset()
+                        paused = False
+                    try:
+                        data = np.frombuffer(stream.read(chunk, exception_on_overflow=True), dtype=np.int16)
+                    except OSError as e:
+                        if e.errno != pyaudio.paInputOverflowed:
+                            raise
+                        # Блок потерян: считаем переполнения и при повторах увеличиваем блок
+                        mic_overflows += 1
+                        now = time.perf_counter()
+                        recent_overflows = [t for t in recent_overflows if now - t < LIVE_OVERFLOW_WINDOW]
+                        recent_overflows.append(now)
+                        log_event("mic_overflow", logging.WARNING, count=mic_overflows, chunk=chunk)
+                        if len(recent_overflows) >= LIVE_OVERFLOW_LIMIT:
+                            recent_overflows = []
+                            step_up_chunk()
+                        continue
+            if data is None:
+                # Пока микрофона нет, речь не обнаружить, поэтому клавиши не должны оставаться нажатыми
+                if is_talking:
+                    release_ptt(active_window, reason="stream_closed")
+                time.sleep(1)
+                paused = True
+                continue
+            new_max_gap = loop_gap_meter.tick()
+            if new_max_gap is not None:
+                log_event("loop_gap_max", gap_ms=round(new_max_gap * 1000, 1), block_ms=round(chunk / rate * 1000, 1))
             current_input_level = np.mean(np.abs(data))
             update_volume_display(current_input_level)
+            log_event("level", logging.DEBUG, volume=float(current_input_level), chunk=chunk, rate=rate)
 
             current_time = time.time()
-            if current_input_level > volume_threshold:
+            # В режиме задержанного мониторинга игра слышит голос позже, поэтому и отпускаем позже
+            release_delay = post_voice_release_delay + (voice_delay_ms if delayed_monitor is not None else 0)
+            if ignoring:
+                pass
+            elif current_input_level > volume_threshold:
                 last_above_threshold_time = current_time
                 if not is_talking:
+                    log_event("ptt_press", volume=float(current_input_level))
+                    if performance_mode:
+                        defer_full_collections()
                     if active_window != "talk to push settings":
                         for key in ptt_key_codes:
                             keyboard_controller.press(key)
@@ -356,18 +487,19 @@ def monitor_mic():
                             new_volume = current_speaker_volume * (1 - fade_sound_percentage / 100)
                             volume_control.SetMasterVolumeLevelScalar(new_volume, None)
                     is_talking = True
-            elif is_talking and (current_time - last_above_threshold_time > post_voice_release_delay / 1000):
-                if active_window != "talk to push settings":
-                    for key in reversed(ptt_key_codes):
-                        keyboard_controller.release(key)
-                    if fade_sound_enabled and original_speaker_volume is not None:
-                        volume_control.SetMasterVolumeLevelScalar(original_speaker_volume, None)
-                        original_speaker_volume = None
-                is_talking = False
+            elif is_talking and (current_time - last_above_threshold_time > release_delay / 1000):
+                release_ptt(active_window)
+
+            # Голос отдаётся в линию задержки только после нажатия клавиш: запись в поток вывода
+            # блокирующая и не должна откладывать нажатие
+            with stream_lock:
+                # Поток мог быть переоткрыт с другим размером блока, пока шло нажатие
+                if delayed_monitor is not None and len(data) == chunk:
+                    delayed_monitor.feed(data)
 
             update_indicator()
         except OSError as e:
-            print(f"Ошибка чтения с микрофона: {e}")
+            log_event("mic_error", logging.ERROR, error=str(e))
 
         time.sleep(0.01)
 
@@ -387,14 +519,191 @@ def update_indicator():
 # ==================== УСТАНОВКА МИКРОФОНА ====================
 def set_microphone_device(device_index):
     """
-    Останавливает предыдущий поток (если существует) и открывает новый поток для выбранного микрофона.
+    Останавливает предыдущий поток (если существует) и открывает новый поток для выбранного микрофона
+    с размером блока, подобранным для этого устройства. Если с подобранным размером поток
+    не открывается, используется DEFAULT_CHUNK.
     """
-    global stream
-    if 'stream' in globals():
+    global stream, stream_device_index, chunk
+    with stream_lock:
+        if stream is not None:
+            stream.stop_stream()
+            stream.close()
+            stream = None
+        stream_device_index = device_index
+        device_name = p.get_device_info_by_index(device_index)['name']
+        chunk = chunk_by_device.get(device_name, DEFAULT_CHUNK)
+        try:
+            stream = p.open(format=audio_format, channels=channels, rate=rate, input=True,
+                            input_device_index=device_index, frames_per_buffer=chunk)
+        except OSError as e:
+            if chunk == DEFAULT_CHUNK:
+                raise
+            log_event("stream_open_failed", logging.WARNING, device=device_name, chunk=chunk, error=str(e))
+            chunk = DEFAULT_CHUNK
+            stream = p.open(format=audio_format, channels=channels, rate=rate, input=True,
+                            input_device_index=device_index, frames_per_buffer=chunk)
+        log_event("stream_opened", device=device_name, chunk=chunk, rate=rate)
+        # Пауза на переоткрытие потока не является задержкой цикла
+        loop_gap_meter.reset()
+        # Линия задержки зависит от размера блока, поэтому пересоздаётся вместе с потоком
+        set_voice_delay_output()
+
+
+def step_up_chunk():
+    """
+    Увеличивает размер блока текущего микрофона до следующего кандидата после повторяющихся
+    переполнений, сохраняет его в настройки и переоткрывает поток.
+    """
+    with stream_lock:
+        new_chunk = next_larger_chunk(chunk)
+        if new_chunk is None:
+            return
+        device_name = p.get_device_info_by_index(stream_device_index)['name']
+        log_event("chunk_stepped_up", logging.WARNING, device=device_name, old_chunk=chunk, chunk=new_chunk)
+        chunk_by_device[device_name] = new_chunk
+        try:
+            save_chunk(device_name, new_chunk)
+        except (OSError, ValueError) as e:
+            log_event("chunk_save_failed", logging.ERROR, device=device_name, error=str(e))
+        set_microphone_device(stream_device_index)
+
+
+def find_device(name_fragment, output=True):
+    """
+    Возвращает индекс первого устройства вывода (или ввода при output=False), в имени которого
+    есть name_fragment, или None.
+    """
+    channels_key = 'maxOutputChannels' if output else 'maxInputChannels'
+    for i in range(p.get_device_count()):
+        info = p.get_device_info_by_index(i)
+        if info[channels_key] > 0 and name_fragment.lower() in info['name'].lower():
+            return info['index']
+    return None
+
+
+def estimated_voice_latency_ms():
+    """
+    Оценка (не замер) добавленной задержки голоса: линия задержки + блок захвата
+    + задержки входного и выходного потоков, которые сообщает PortAudio.
+    """
+    return voice_delay_ms + (chunk / rate + stream.get_input_latency() + output_stream.get_output_latency()) * 1000
+
+
+def set_voice_delay_output():
+    """
+    Открывает поток вывода задержанного голоса и линию задержки (если режим включён)
+    и записывает в журнал оценку добавленной задержки (замер — calibrate_voice_delay()).
+    """
+    global output_stream, delayed_monitor
+    with stream_lock:
+        delayed_monitor = None
+        if output_stream is not None:
+            output_stream.stop_stream()
+            output_stream.close()
+            output_stream = None
+        if not voice_delay_enabled:
+            return
+        output_index = find_device(voice_delay_output)
+        if output_index is None:
+            log_event("voice_delay_output_missing", logging.WARNING, device=voice_delay_output)
+            return
+        try:
+            output_stream = p.open(format=audio_format, channels=channels, rate=rate, output=True,
+                                   output_device_index=output_index, frames_per_buffer=chunk)
+        except OSError as e:
+            # Без вывода голос в игру не идёт, но PTT продолжает работать как без задержки
+            log_event("voice_delay_output_failed", logging.WARNING, device=voice_delay_output, error=str(e))
+            return
+        delayed_monitor = DelayedMonitor(output_stream, voice_delay_ms, rate, chunk)
+        log_event("voice_delay_started", delay_ms=voice_delay_ms,
+                  estimated_latency_ms=round(estimated_voice_latency_ms(), 1))
+
+
+def calibrate_voice_delay():
+    """
+    Замеряет задержку голоса на настоящем пути: импульс через линию задержки и поток вывода
+    записывается со стороны захвата кабеля (voice_delay_capture). Результат пишется в журнал
+    рядом с оценкой. На время замера (около секунды) чтение микрофона останавливается,
+    поэтому замер не выполняется, пока нажат PTT.
+    """
+    capture_index = find_device(voice_delay_capture, output=False)
+    if capture_index is None:
+        log_event("voice_delay_capture_missing", logging.WARNING, device=voice_delay_capture)
+        return
+    with stream_lock:
+        if delayed_monitor is None or stream is None or is_talking:
+            log_event("voice_delay_calibration_skipped", logging.WARNING, enabled=delayed_monitor is not None,
+                      stream_open=stream is not None, talking=is_talking)
+            return
+        # Остановленный поток не переполняется, пока мониторинг ждёт замера
         stream.stop_stream()
-        stream.close()
-    stream = p.open(format=audio_format, channels=channels, rate=rate, input=True,
-                    input_device_index=device_index, frames_per_buffer=chunk)
+        try:
+            capture = p.open(format=audio_format, channels=channels, rate=rate, input=True,
+                             input_device_index=capture_index, frames_per_buffer=chunk)
+            try:
+                measured_ms = measure_loopback_latency(output_stream, capture, voice_delay_ms, rate, chunk)
+            finally:
+                capture.stop_stream()
+                capture.close()
+            log_event("voice_delay_measured", delay_ms=voice_delay_ms,
+                      estimated_latency_ms=round(estimated_voice_latency_ms(), 1),
+                      measured_latency_ms=round(measured_ms, 1))
+        except (OSError, ValueError) as e:
+            log_event("voice_delay_calibration_failed", logging.WARNING, device=voice_delay_capture, error=str(e))
+        finally:
+            stream.start_stream()
+            loop_gap_meter.reset()
+            delayed_monitor.reset()
+
+
+def start_voice_delay_calibration():
+    """
+    Запускает замер задержки голоса в отдельном потоке (если он ещё не идёт).
+    """
+    global voice_delay_calibration_thread
+    if voice_delay_calibration_thread is not None and voice_delay_calibration_thread.is_alive():
+        return
+    voice_delay_calibration_thread = threading.Thread(target=calibrate_voice_delay, daemon=True)
+    voice_delay_calibration_thread.start()
+
+
+def tune_microphone_chunk():
+    """
+    Подбирает наименьший стабильный размер блока для текущего микрофона, сохраняет его
+    в настройки и переоткрывает поток. stream_lock берётся только на закрытие и открытие потока:
+    пока идёт подбор, мониторинг видит stream = None и отпускает клавиши.
+    Поток переоткрывается в любом случае, даже если подбор или сохранение не удались.
+    """
+    global stream
+    device_index, device_name = microphones[selected_mic_index]
+    with stream_lock:
+        if stream is not None:
+            stream.stop_stream()
+            stream.close()
+            stream = None
+    try:
+        log_event("chunk_tuning_started", device=device_name)
+        new_chunk = tune_chunk(p, device_index, rate=rate,
+                               on_result=lambda result, stable: log_event("chunk_measured", stable=stable, **result))
+        chunk_by_device[device_name] = new_chunk
+        log_event("chunk_tuned", device=device_name, chunk=new_chunk)
+        save_chunk(device_name, new_chunk)
+    except (OSError, ValueError) as e:
+        # ValueError включает JSONDecodeError испорченного файла настроек
+        log_event("chunk_tuning_failed", logging.ERROR, device=device_name, error=str(e))
+    finally:
+        set_microphone_device(device_index)
+
+
+def start_chunk_tuning():
+    """
+    Запускает подбор размера блока в отдельном потоке (если он ещё не идёт).
+    """
+    global chunk_tuning_thread
+    if chunk_tuning_thread is not None and chunk_tuning_thread.is_alive():
+        return
+    chunk_tuning_thread = threading.Thread(target=tune_microphone_chunk, daemon=True)
+    chunk_tuning_thread.start()
 
 
 # ==================== ФУНКЦИИ ОКНА НАСТРОЕК И ВЫХОДА ====================
@@ -417,13 +726,19 @@ def exit_program():
             microphone_volume.SetMasterVolumeLevelScalar(stored_microphone_volume, None)
     except:
         pass
+    log_event("loop_gap_summary", max_gap_ms=round(loop_gap_meter.max_gap * 1000, 1), overflows=mic_overflows,
+              performance_mode=performance_mode)
     icon.stop()
     root.quit()
     root.destroy()
-    if 'stream' in globals():
+    if stream is not None:
         stream.stop_stream()
         stream.close()
+    if output_stream is not None:
+        output_stream.stop_stream()
+        output_stream.close()
     p.terminate()
+    stop_logging()
     os._exit(0)
 
 
@@ -732,11 +1047,14 @@ icon_data = base64.b64decode(encoded_icon)
 icon_image = Image.open(BytesIO(icon_data))
 
 # Теперь можно использовать картинку как обычно
-tray_menu = (item('Settings', show_settings), item('Exit', exit_program))
+tray_menu = (item('Settings', show_settings), item('Tune frame size', start_chunk_tuning),
+             item('Measure voice delay', start_voice_delay_calibration), item('Exit', exit_program))
 icon = Icon("MicTrigger", icon_image, menu=tray_menu)
 
 # ==================== ЗАПУСК ПРОГРАММЫ ====================
 set_microphone_device(microphones[selected_mic_index][0])
+if auto_tune_chunk and microphones[selected_mic_index][1] not in chunk_by_device:
+    start_chunk_tuning()
 monitor_thread = threading.Thread(target=monitor_mic, daemon=True)
 monitor_thread.start()
 
@@ -748,4 +1066,8 @@ def start_pystray():
 pystray_thread = threading.Thread(target=start_pystray, daemon=True)
 pystray_thread.start()
 
+# Всё, что создано при запуске (окна, настройки, модули), больше не сканируется сборщиком мусора
+if performance_mode:
+    freeze_gc()
+
 root.mainloop()
@@ -0,0 +1,236 @@
+"""
+Задержанный мониторинг голоса.
+
+Звук микрофона проходит через программу в виртуальное устройство вывода (например, VB-Cable),
+которое игра использует как микрофон, с задержкой на N мс. Клавиша PTT нажимается сразу
+при обнаружении речи, поэтому к моменту, когда первый слог доходит до игры, она уже нажата.
+Отпускание откладывается на ту же задержку.
+
+Задержка реализована кольцевым буфером, выделенным один раз при открытии потока.
+
+Задержку живого конвейера замеряет measure_loopback_latency(): шумовой импульс проходит через
+линию задержки в поток вывода, записывается со стороны захвата виртуального кабеля (то, что слышит
+игра), и сдвиг находится по взаимной корреляции. В замер входят линия задержки, буферы вывода,
+кабель и его буфер захвата; захват самого микрофона (блок и задержка входа) в него не входит.
+
+Для проверки без звуковых устройств источник и приёмник можно заменить WAV-файлами:
+    python voice_delay.py input.wav output.wav --delay-ms 150
+Команда прогоняет запись через тот же конвейер и измеряет задержку, добавленную линией задержки.
+Реальных устройств в этом режиме нет, поэтому результат равен delay_samples / rate.
+"""
+import argparse
+import time
+import wave
+
+import numpy as np
+
+CALIBRATION_SECONDS = 1.0  # Длительность записи при замере через кабель; должна превышать задержку
+CALIBRATION_LEAD_BLOCKS = 2  # Блоки тишины перед импульсом, пока потоки выходят на установившийся режим
+IMPULSE_SAMPLES = 256
+MIN_CORRELATION = 0.5  # Нормированная корреляция, ниже которой импульс считается не найденным
+
+
+class DelayLine:
+    """
+    Линия задержки на delay_samples отсчётов для блоков не длиннее block_size.
+    Буфер и выходной массив выделяются один раз, process() не выделяет память.
+    """
+
+    def __init__(self, delay_samples, block_size):
+        self.delay_samples = delay_samples
+        self.buffer = np.zeros(delay_samples + block_size, dtype=np.int16)
+        self.output = np.zeros(block_size, dtype=np.int16)
+        self.write_pos = 0
+
+    def process(self, block):
+        """
+        Записывает блок и возвращает блок той же длины, задержанный на delay_samples.
+        Возвращаемый массив переиспользуется при следующем вызове.
+        """
+        size = len(self.buffer)
+        n = len(block)
+        self._copy_in(block, self.write_pos, size)
+        read_pos = (self.write_pos - self.delay_samples) % size
+        self._copy_out(self.output[:n], read_pos, size)
+        self.write_pos = (self.write_pos + n) % size
+        return self.output[:n]
+
+    def reset(self):
+        """
+        Заполняет линию тишиной, чтобы после паузы не воспроизводился звук, записанный до неё.
+        """
+        self.buffer[:] = 0
+        self.write_pos = 0
+
+    def _copy_in(self, block, pos, size):
+        first = min(len(block), size - pos)
+        self.buffer[pos:pos + first] = block[:first]
+        self.buffer[:len(block) - first] = block[first:]
+
+    def _copy_out(self, out, pos, size):
+        first = min(len(out), size - pos)
+        out[:first] = self.buffer[pos:pos + first]
+        out[first:] = self.buffer[:len(out) - first]
+
+
+class DelayedMonitor:
+    """
+    Пропускает блоки микрофона через DelayLine в приёмник с методом write(bytes):
+    поток PyAudio на вывод или WaveSink.
+    """
+
+    def __init__(self, sink, delay_ms, rate, block_size):
+        self.sink = sink
+        self.delay_ms = delay_ms
+        self.delay_line = DelayLine(int(round(delay_ms * rate / 1000)), block_size)
+
+    def feed(self, block):
+        self.sink.write(self.delay_line.process(block).tobytes())
+
+    def reset(self):
+        self.delay_line.reset()
+
+
+# ==================== ФАЙЛОВЫЕ УСТРОЙСТВА ====================
+
+class WaveSource:
+    """
+    Источник с интерфейсом потока PyAudio на ввод, читающий 16-битный моно WAV.
+    """
+
+    def __init__(self, path):
+        self.wav = wave.open(path, 'rb')
+        if self.wav.getsampwidth() != 2 or self.wav.getnchannels() != 1:
+            raise ValueError(f"{path}: нужен 16-битный моно WAV")
+        self.rate = self.wav.getframerate()
+
+    def read(self, num_frames, exception_on_overflow=False):
+        return self.wav.readframes(num_frames)
+
+    def close(self):
+        self.wav.close()
+
+
+class WaveSink:
+    """
+    Приёмник с интерфейсом потока PyAudio на вывод, пишущий 16-битный моно WAV.
+    """
+
+    def __init__(self, path, rate):
+        self.wav = wave.open(path, 'wb')
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(rate)
+
+    def write(self, frames):
+        self.wav.writeframes(frames)
+
+    def close(self):
+        self.wav.close()
+
+
+def run_file_pipeline(input_path, output_path, delay_ms, block_size=2205):
+    """
+    Прогоняет WAV через DelayedMonitor блоками block_size и дописывает хвост длиной в задержку.
+    Возвращает времена обработки блоков в секундах.
+    """
+    source = WaveSource(input_path)
+    sink = WaveSink(output_path, source.rate)
+    monitor = DelayedMonitor(sink, delay_ms, source.rate, block_size)
+    process_times = []
+    try:
+        while True:
+            frames = source.read(block_size)
+            if not frames:
+                break
+            started = time.perf_counter()
+            monitor.feed(np.frombuffer(frames, dtype=np.int16))
+            process_times.append(time.perf_counter() - started)
+        # Выталкиваем из линии задержки последние delay_ms звука
+        silence = np.zeros(block_size, dtype=np.int16)
+        for _ in range(-(-monitor.delay_line.delay_samples // block_size)):
+            monitor.feed(silence)
+    finally:
+        source.close()
+        sink.close()
+    return process_times
+
+
+def find_offset(reference, recording):
+    """
+    Находит сдвиг (в отсчётах), с которым reference входит в recording, по максимуму взаимной корреляции.
+    Возвращает сдвиг и нормированную корреляцию в этой точке (1 — форма совпала точно, громкость не важна).
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    recording = np.asarray(recording, dtype=np.float64)
+    size = len(reference) + len(recording)
+    spectrum = np.fft.rfft(recording, size) * np.conj(np.fft.rfft(reference, size))
+    correlation = np.fft.irfft(spectrum, size)[:len(recording)]
+    offset = int(np.argmax(correlation))
+    segment = recording[offset:offset + len(reference)]
+    norm = np.linalg.norm(reference[:len(segment)]) * np.linalg.norm(segment)
+    return offset, (correlation[offset] / norm if norm > 0 else 0.0)
+
+
+def measure_latency(input_path, output_path):
+    """
+    Измеряет сдвиг выходной записи относительно входной (мс) по максимуму взаимной корреляции.
+    Для записей из run_file_pipeline это задержка самой линии задержки.
+    """
+    with wave.open(input_path, 'rb') as wav:
+        rate = wav.getframerate()
+        source = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    with wave.open(output_path, 'rb') as wav:
+        delayed = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    return find_offset(source, delayed)[0] / rate * 1000
+
+
+def measure_loopback_latency(sink, capture, delay_ms, rate, block_size, seconds=CALIBRATION_SECONDS):
+    """
+    Замеряет задержку (мс) от подачи блока в линию задержки до его появления на стороне захвата
+    виртуального кабеля. sink — поток вывода в кабель, capture — поток ввода с кабеля
+    (интерфейсы потоков PyAudio). Каждый прочитанный блок уравновешивается записанным, поэтому
+    число прочитанных к моменту записи импульса отсчётов — это время записи по часам захвата.
+    Бросает ValueError, если импульс не найден в записи.
+    """
+    monitor = DelayedMonitor(sink, delay_ms, rate, block_size)
+    burst = np.random.default_rng(0).integers(-8000, 8000, IMPULSE_SAMPLES, dtype=np.int16)
+    impulse = np.zeros(block_size, dtype=np.int16)
+    impulse[:IMPULSE_SAMPLES] = burst[:block_size]
+    silence = np.zeros(block_size, dtype=np.int16)
+
+    recorded = []
+    written_at = None
+    for i in range(max(-(-int(seconds * rate) // block_size), CALIBRATION_LEAD_BLOCKS + 1)):
+        recorded.append(np.frombuffer(capture.read(block_size, exception_on_overflow=False), dtype=np.int16))
+        if i == CALIBRATION_LEAD_BLOCKS:
+            written_at = sum(len(block) for block in recorded)
+            monitor.feed(impulse)
+        else:
+            monitor.feed(silence)
+
+    offset, correlation = find_offset(impulse[:IMPULSE_SAMPLES], np.concatenate(recorded))
+    if correlation < MIN_CORRELATION or offset < written_at:
+        raise ValueError("calibration impulse not found in the capture recording")
+    return (offset - written_at) / rate * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the delayed-monitor pipeline on WAV files and measure the delay-line latency.")
+    parser.add_argument("input", help="16-bit mono WAV used as the microphone")
+    parser.add_argument("output", help="WAV written in place of the virtual output device")
+    parser.add_argument("--delay-ms", type=float, default=150, help="monitor delay in ms")
+    parser.add_argument("--block-size", type=int, default=2205, help="capture block size (chunk)")
+    args = parser.parse_args()
+
+    process_times = np.array(run_file_pipeline(args.input, args.output, args.delay_ms, args.block_size)) * 1000
+    print(f"Configured delay: {args.delay_ms:.1f} ms")
+    print(f"Measured delay-line latency: {measure_latency(args.input, args.output):.1f} ms "
+          f"(files only; use 'Measure voice delay' in the tray menu for the real path)")
+    if len(process_times):
+        print(f"Block processing: mean {process_times.mean():.3f} ms, max {process_times.max():.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
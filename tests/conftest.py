@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули лежат в src и импортируют друг друга по имени, как при запуске из этой папки
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
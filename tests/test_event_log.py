@@ -0,0 +1,43 @@
+import json
+
+from event_log import setup_logging, stop_logging, log_event, log_files, read_events, read_sessions
+
+
+def write_lines(path, events):
+    with open(path, 'w', encoding='utf-8') as file:
+        for event in events:
+            file.write(json.dumps(event) + "\n")
+
+
+def test_sessions_span_rotated_files(tmp_path):
+    path = str(tmp_path / "talk-to-press.log")
+    for session in range(2):
+        setup_logging("DEBUG", "jsonl", path, max_bytes=2000, backup_count=50, chunk=441, rate=22050)
+        for i in range(60):
+            log_event("level", volume=float(i), chunk=441, rate=22050, session=session)
+        log_event("ptt_press", volume=1.0)
+    stop_logging()
+
+    assert len(log_files(path)) > 2
+    sessions = read_sessions(path, events={"level"})
+    assert len(sessions) == 2
+    for number, session in enumerate(sessions):
+        assert session[0]["event"] == "session_start"
+        levels = session[1:]
+        assert [event["volume"] for event in levels] == [float(i) for i in range(60)]
+        assert {event["session"] for event in levels} == {number}
+    assert len(list(read_events(path, "ptt_press"))) == 2
+
+
+def test_events_before_first_session_start_form_a_session(tmp_path):
+    path = str(tmp_path / "talk-to-press.log")
+    # Начало первой сессии ушло при ротации: копия .1 начинается с середины сессии
+    write_lines(path + ".1", [{"event": "level", "t": 1.0}, {"event": "ptt_press", "t": 1.1}])
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("2025-01-01 00:00:00 INFO    [MainThread] text line\n")
+        file.write(json.dumps({"event": "session_start", "t": 5.0}) + "\n")
+        file.write(json.dumps({"event": "level", "t": 5.1}) + "\n")
+
+    sessions = read_sessions(path, events={"level"})
+    assert [[event["event"] for event in session] for session in sessions] == [["level"], ["session_start", "level"]]
+    assert [event["t"] for event in read_events(path)] == [1.0, 1.1, 5.0, 5.1]
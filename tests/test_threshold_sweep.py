@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+import pytest
+
+import threshold_sweep
+from threshold_sweep import evaluate_series, pareto_front
+
+
+def brute_force_series(levels, speech_share, frame_duration, threshold, delay):
+    """
+    Покадровая модель monitor_mic для одной пары порог/задержка: кадр открыт, если последнее
+    превышение порога до него было не больше delay секунд назад.
+    """
+    open_speech = open_total = 0.0
+    last_above = None
+    for k, level in enumerate(levels):
+        if last_above is not None and (k - 1 - last_above) * frame_duration <= delay:
+            open_speech += speech_share[k]
+            open_total += 1
+        if level > threshold:
+            last_above = k
+    return open_speech * frame_duration, open_total * frame_duration
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(1)
+    levels = rng.gamma(2.0, 300.0, 400)
+    speech_share = np.clip(rng.normal(0.5, 0.5, 400), 0, 1)
+    return levels, speech_share, 0.1
+
+
+def test_evaluate_series_matches_brute_force(series):
+    levels, speech_share, frame_duration = series
+    thresholds = np.array([100.0, 500.0, 700.0, 1500.0, 5000.0])
+    delays = np.array([0.0, 0.1, 0.35, 0.8, 2.0])
+    open_speech, open_total = evaluate_series(levels, speech_share, frame_duration, thresholds, delays)
+    for i, delay in enumerate(delays):
+        for j, threshold in enumerate(thresholds):
+            expected = brute_force_series(levels, speech_share, frame_duration, threshold, delay)
+            assert open_speech[i, j] == pytest.approx(expected[0])
+            assert open_total[i, j] == pytest.approx(expected[1])
+
+
+def test_evaluate_series_blocks_match_single_pass(series, monkeypatch):
+    levels, speech_share, frame_duration = series
+    thresholds = np.array([300.0, 700.0, 1200.0])
+    delays = np.array([0.0, 0.25, 1.0])
+    whole = evaluate_series(levels, speech_share, frame_duration, thresholds, delays)
+    # Блоки по 7 кадров: номер последнего превышения должен переноситься между ними
+    monkeypatch.setattr(threshold_sweep, "BLOCK_ELEMENTS", 7 * len(thresholds) * len(delays))
+    blocked = evaluate_series(levels, speech_share, frame_duration, thresholds, delays)
+    np.testing.assert_allclose(blocked, whole)
+
+
+def test_pareto_front_keeps_only_non_dominated_rows():
+    rng = np.random.default_rng(2)
+    rows = np.column_stack([np.zeros((300, 3)), rng.integers(0, 20, (300, 2)).astype(float)])
+    front = pareto_front(rows)
+
+    pairs = {tuple(row) for row in rows[:, 3:]}
+    expected = {(c, f) for c, f in pairs
+                if not any(oc <= c and of <= f and (oc, of) != (c, f) for oc, of in pairs)}
+    assert [tuple(row) for row in front[:, 3:]] == sorted(expected)
+
+
+def union_overlap(intervals, start, end):
+    """
+    Длина пересечения отрезка с объединением интервалов, по отсортированным интервалам.
+    """
+    total, covered_to = 0.0, start
+    for a, b in sorted(map(tuple, intervals)):
+        a, b = max(a, covered_to), min(b, end)
+        if b > a:
+            total += b - a
+            covered_to = b
+    return total
+
+
+def test_speech_overlap_counts_overlapping_labels_once():
+    rng = np.random.default_rng(3)
+    label_starts = rng.uniform(0, 30, 40)
+    intervals = np.column_stack([label_starts, label_starts + rng.uniform(0, 2, 40)])
+    starts = np.sort(rng.uniform(-1, 33, 200))
+    ends = starts + rng.uniform(0, 0.5, 200)
+    expected = [union_overlap(intervals, a, b) for a, b in zip(starts, ends)]
+    np.testing.assert_allclose(threshold_sweep.speech_overlap(intervals, starts, ends), expected, atol=1e-9)
+    assert not threshold_sweep.speech_overlap(np.empty((0, 2)), starts, ends).any()
+
+
+def test_read_session_splits_on_chunk_change(tmp_path):
+    log_path = tmp_path / "talk-to-press.log"
+    labels_path = tmp_path / "talk-to-press.txt"
+    events = [{"event": "session_start", "t": 100.0}]
+    events += [{"event": "level", "t": 100.0 + (i + 1) * 0.1, "volume": float(i), "chunk": 2205, "rate": 22050}
+               for i in range(10)]
+    events += [{"event": "level", "t": 101.0 + (i + 1) * 0.02, "volume": 0.0, "chunk": 441, "rate": 22050}
+               for i in range(5)]
+    log_path.write_text("".join(json.dumps(event) + "\n" for event in events), encoding='utf-8')
+    # Речь с 0.25 до 0.5 с от начала сессии, вторая метка перекрывает первую
+    labels_path.write_text("0.25\t0.4\tspeech\n0.3\t0.5\n", encoding='utf-8')
+
+    segments = threshold_sweep.read_session(str(log_path), str(labels_path))
+    assert [(len(levels), frame, rate) for levels, _, frame, rate in segments] == [(10, 2205, 22050), (5, 441, 22050)]
+    np.testing.assert_allclose(segments[0][1], [0, 0, 0.5, 1, 1, 0, 0, 0, 0, 0], atol=1e-9)
+    assert not segments[1][1].any()
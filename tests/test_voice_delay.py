@@ -0,0 +1,88 @@
+import wave
+
+import numpy as np
+import pytest
+
+from voice_delay import DelayLine, run_file_pipeline, measure_latency, measure_loopback_latency
+
+
+def shifted(signal, delay):
+    return np.concatenate([np.zeros(delay, dtype=signal.dtype), signal])[:len(signal)]
+
+
+@pytest.mark.parametrize("delay, block_size", [(0, 441), (1, 441), (3308, 2205), (441, 441), (5000, 441), (700, 2205)])
+def test_delay_line_shifts_input(delay, block_size):
+    signal = np.random.default_rng(delay).integers(-30000, 30000, 20000, dtype=np.int16)
+    line = DelayLine(delay, block_size)
+    output = np.concatenate([line.process(signal[i:i + block_size]).copy()
+                             for i in range(0, len(signal), block_size)])
+    np.testing.assert_array_equal(output, shifted(signal, delay))
+
+
+def test_delay_line_reset_drops_buffered_audio():
+    line = DelayLine(1000, 441)
+    for _ in range(5):
+        line.process(np.full(441, 1000, dtype=np.int16))
+    line.reset()
+    assert not line.process(np.zeros(441, dtype=np.int16)).any()
+
+
+def write_wave(path, samples, rate):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+
+
+def test_file_pipeline_delays_recording(tmp_path):
+    rate = 22050
+    samples = np.random.default_rng(0).integers(-8000, 8000, 3 * rate, dtype=np.int16)
+    input_path, output_path = tmp_path / "in.wav", tmp_path / "out.wav"
+    write_wave(input_path, samples, rate)
+
+    process_times = run_file_pipeline(str(input_path), str(output_path), 150, block_size=2205)
+    assert len(process_times) == -(-len(samples) // 2205)
+    assert measure_latency(str(input_path), str(output_path)) == pytest.approx(150, abs=1000 / rate)
+    with wave.open(str(output_path), 'rb') as wav:
+        delayed = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    delay = int(round(150 * rate / 1000))
+    np.testing.assert_array_equal(delayed[delay:delay + len(samples)], samples)
+
+
+class Loopback:
+    """
+    Виртуальный кабель в памяти: записанное читается обратно после lag отсчётов и с другой громкостью.
+    """
+
+    def __init__(self, lag, gain=0.3, connected=True):
+        self.buffer = np.zeros(lag, dtype=np.int16)
+        self.gain = gain
+        self.connected = connected
+
+    def write(self, frames):
+        if self.connected:
+            block = (np.frombuffer(frames, dtype=np.int16) * self.gain).astype(np.int16)
+            self.buffer = np.concatenate([self.buffer, block])
+
+    def read(self, num_frames, exception_on_overflow=False):
+        block = np.zeros(num_frames, dtype=np.int16)
+        available = min(num_frames, len(self.buffer))
+        block[:available] = self.buffer[:available]
+        self.buffer = self.buffer[available:]
+        return block.tobytes()
+
+
+@pytest.mark.parametrize("lag, block_size", [(2205, 2205), (3000, 441), (5000, 882)])
+def test_loopback_latency_measures_delay_and_cable(lag, block_size):
+    rate = 22050
+    cable = Loopback(lag)
+    # Запись идёт после чтения блока, поэтому к задержке линии добавляется lag - block_size
+    expected = (int(round(150 * rate / 1000)) + lag - block_size) / rate * 1000
+    assert measure_loopback_latency(cable, cable, 150, rate, block_size) == pytest.approx(expected)
+
+
+def test_loopback_latency_without_signal_raises():
+    cable = Loopback(3000, connected=False)
+    with pytest.raises(ValueError):
+        measure_loopback_latency(cable, cable, 150, 22050, 441)